@@ -4,6 +4,8 @@
 # For full terms, see the included LICENSE file.
 # -----------------------------------------------------------------------------
 
+from collections.abc import Collection
+
 from gitfourchette.forms.brandeddialog import convertToBrandedDialog
 from gitfourchette.forms.ui_newbranchdialog import Ui_NewBranchDialog
 from gitfourchette.localization import *
@@ -18,8 +20,9 @@ class NewBranchDialog(QDialog):
             target: str,
             targetSubtitle: str,
             upstreams: list[str],
-            reservedNames: list[str],
+            reservedNames: Collection[str],
             allowSwitching: bool,
+            hasSubmodules: bool = True,
             parent=None):
 
         super().__init__(parent)
@@ -41,6 +44,10 @@ class NewBranchDialog(QDialog):
             self.ui.upstreamCheckBox.setVisible(False)
             self.ui.upstreamComboBox.setVisible(False)
 
+        if not hasSubmodules:
+            self.ui.recurseSubmodulesCheckBox.setChecked(False)
+            self.ui.recurseSubmodulesCheckBox.setVisible(False)
+
         if not allowSwitching:
             switchCheckBox = self.ui.switchToBranchCheckBox
             switchCheckBox.setEnabled(False)
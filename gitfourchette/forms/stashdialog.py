@@ -38,7 +38,7 @@ class StashDialog(QDialog):
     def __init__(
             self,
             repoStatus: dict[str, int],
-            preTicked: list[str],
+            preTicked: set[str],
             parent: QWidget):
         super().__init__(parent)
 
@@ -10,6 +10,7 @@ import configparser as _configparser
 import dataclasses as _dataclasses
 import datetime
 import enum
+import functools as _functools
 import logging as _logging
 import os as _os
 import re as _re
@@ -139,11 +140,13 @@ class RefPrefix:
     REMOTES = "refs/remotes/"
     TAGS = "refs/tags/"
 
+    _SPLIT_TABLE = ((HEADS, len(HEADS)), (REMOTES, len(REMOTES)), (TAGS, len(TAGS)))
+
     @classmethod
     def split(cls, refname: str) -> tuple[str, str]:
-        for prefix in cls.HEADS, cls.REMOTES, cls.TAGS:
+        for prefix, prefix_length in cls._SPLIT_TABLE:
             if refname.startswith(prefix):
-                return prefix, refname[len(prefix):]
+                return prefix, refname[prefix_length:]
         return "", refname
 
 
@@ -329,7 +332,7 @@ def split_remote_branch_shorthand(remote_branch_name: str) -> tuple[str, str]:
         return remote_branch_name, ""
 
 
-def validate_refname(name: str, reserved_names: list[str]):
+def validate_refname(name: str, reserved_names: _typing.Collection[str]):
     """
     Checks the validity of a ref name according to `man git-check-ref-format`.
     Raises NameValidationError if the name is incorrect.
@@ -452,6 +455,7 @@ def DiffFile_compare(f1: DiffFile, f2: DiffFile):
     return same
 
 
+@_functools.lru_cache(maxsize=256)  # the sidebar re-strips every stash message on each refresh
 def strip_stash_message(stash_message: str) -> str:
     m = CORE_STASH_MESSAGE_PATTERN.match(stash_message)
     if m:
@@ -581,35 +585,52 @@ class GitConfigHelper:
 
     @staticmethod
     def scrub_empty_section(config_path: str, *section_key_tokens: str):
-        num_tokens = len(section_key_tokens)
-        if num_tokens == 1:
-            section_key = section_key_tokens[0]
-        elif num_tokens == 2:
-            prefix, name = section_key_tokens
-            name = name.replace('"', r'\"')
-            section_key = f'{prefix} "{name}"'
-        else:
-            raise NotImplementedError("scrub_empty_section: Section key must be 1 or 2 tokens")
+        GitConfigHelper.scrub_empty_sections(config_path, [section_key_tokens])
+
+    @staticmethod
+    def scrub_empty_sections(config_path: str, sections: _typing.Iterable[_typing.Sequence[str]]):
+        """
+        Remove several empty sections from a config file, parsing and
+        rewriting the file only once.
+        """
+        section_keys = []
+        for section_key_tokens in sections:
+            num_tokens = len(section_key_tokens)
+            if num_tokens == 1:
+                section_key = section_key_tokens[0]
+            elif num_tokens == 2:
+                prefix, name = section_key_tokens
+                name = name.replace('"', r'\"')
+                section_key = f'{prefix} "{name}"'
+            else:
+                raise NotImplementedError("scrub_empty_section: Section key must be 1 or 2 tokens")
+            section_keys.append(section_key)
 
         # strict=False: Don't raise DuplicateSectionError.
         # If there are duplicate sections, their contents are merged.
         ini = _configparser.ConfigParser(strict=False)
         ini.read(config_path)
 
-        # Get section. Bail if it doesn't appear in the file.
-        try:
-            section = ini[section_key]
-            assert isinstance(section, _configparser.SectionProxy)
-        except KeyError:
-            _logger.debug(f"scrub_empty_section: Section [{section_key}] doesn't appear, no scrubbing needed")
-            return
+        evict = set()
+        for section_key in section_keys:
+            # Get section. Skip it if it doesn't appear in the file.
+            try:
+                section = ini[section_key]
+                assert isinstance(section, _configparser.SectionProxy)
+            except KeyError:
+                _logger.debug(f"scrub_empty_section: Section [{section_key}] doesn't appear, no scrubbing needed")
+                continue
 
-        # Bail if section isn't empty.
-        if len(section) != 0:
-            _logger.debug(f"scrub_empty_section: Section [{section_key}] isn't empty, won't scrub")
-            return
+            # Skip section if it isn't empty.
+            if len(section) != 0:
+                _logger.debug(f"scrub_empty_section: Section [{section_key}] isn't empty, won't scrub")
+                continue
 
-        _logger.debug(f"scrub_empty_section: Scrubbing empty section [{section_key}]")
+            _logger.debug(f"scrub_empty_section: Scrubbing empty section [{section_key}]")
+            evict.add(f"[{section_key}]\n")
+
+        if not evict:
+            return
 
         # We could call ini.remove_section(section_key) then write the ini back
         # to disk, but this destroys the file's formatting. So, remove the
@@ -617,8 +638,7 @@ class GitConfigHelper:
         # the config file is fragmented (several remnants of empty sections).
         with open(config_path, encoding="utf-8") as f:
             lines = f.readlines()
-        evict = f"[{section_key}]\n"
-        lines = [line for line in lines if line != evict]
+        lines = [line for line in lines if line not in evict]
 
         # Write result to disk.
         timestamp = datetime.datetime.now().timestamp()
@@ -770,6 +790,14 @@ class Repo(_VanillaRepository):
         """
         self.index.read(force)
 
+    def refresh_index_and_check_conflicts(self) -> bool:
+        """
+        Reload the index (see refresh_index) and return True if it contains any conflicts.
+        Use this after an external git command that may have left conflicts behind.
+        """
+        self.refresh_index()
+        return self.any_conflicts
+
     def get_uncommitted_changes(self, show_binary: bool = False, context_lines: int = 3) -> Diff:
         """
         Get a Diff of all uncommitted changes in the working directory,
@@ -929,11 +957,39 @@ class Repo(_VanillaRepository):
         self.scrub_empty_config_section("branch", name)
         return branch
 
-    def delete_local_branch(self, name: str):
-        """Delete a local branch."""
+    def rename_local_branches(
+            self,
+            renames: _typing.Iterable[tuple[str, str]],
+            progress_callback: _typing.Callable[[int], None] | None = None,
+            progress_interval: int = 16):
+        """
+        Rename several local branches.
+        Leftover config sections are scrubbed in a single pass at the end,
+        even if one of the renames fails partway through.
+
+        If given, progress_callback receives the number of branches renamed
+        so far, every progress_interval renames and once more at the end.
+        """
+        old_names = []
+        try:
+            for name, new_name in renames:
+                self.branches.local[name].rename(new_name)
+                old_names.append(name)
+                if progress_callback is not None and len(old_names) % progress_interval == 0:
+                    progress_callback(len(old_names))
+            if progress_callback is not None and len(old_names) % progress_interval != 0:
+                progress_callback(len(old_names))  # report the final count
+        finally:
+            self.scrub_empty_config_sections(("branch", name) for name in old_names)
+
+    def delete_local_branch(self, name: str) -> Oid:
+        """Delete a local branch. Return the commit that was at its tip."""
         # TODO: if remote-tracking, let user delete upstream too?
-        self.branches.local.delete(name)
+        branch = self.branches.local[name]
+        target = branch.target
+        branch.delete()
         self.scrub_empty_config_section("branch", name)
+        return target
 
     def scrub_empty_config_section(self, *section_key_tokens: str):
         """
@@ -945,6 +1001,14 @@ class Repo(_VanillaRepository):
         config_path = _joinpath(self.path, "config")
         GitConfigHelper.scrub_empty_section(config_path, *section_key_tokens)
 
+    def scrub_empty_config_sections(self, sections: _typing.Iterable[_typing.Sequence[str]]):
+        """
+        Same as scrub_empty_config_section, but for several sections at once.
+        The config file is only rewritten once.
+        """
+        config_path = _joinpath(self.path, "config")
+        GitConfigHelper.scrub_empty_sections(config_path, sections)
+
     def create_branch_on_head(self, name: str) -> Branch:
         """Create a local branch pointing to the commit at the current HEAD."""
         return self.create_branch(name, self.head_commit)
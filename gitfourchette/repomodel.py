@@ -90,6 +90,12 @@ class RepoModel:
     refsAt: dict[Oid, list[str]]
     "Get all reference names pointing at a given commit ID."
 
+    localBranchNames: tuple[str, ...]
+    "Sorted shorthand names of local branches that point to commits (like refs), as of the last syncRefs."
+
+    localBranchNameSet: frozenset[str]
+    "Same as localBranchNames, for fast membership tests (e.g. in name validators)."
+
     mergeheads: list[Oid]
 
     stashes: list[Oid]
@@ -160,6 +166,8 @@ class RepoModel:
 
         self.refs = {}
         self.refsAt = {}
+        self.localBranchNames = ()
+        self.localBranchNameSet = frozenset()
         self.mergeheads = []
         self.stashes = []
         self.submodules = {}
@@ -208,6 +216,11 @@ class RepoModel:
     def singleRemote(self) -> bool:
         return len(self.remotes) == 1
 
+    @property
+    def hasSubmodules(self) -> bool:
+        """ Whether .gitmodules declared any submodules as of the last syncSubmodules. """
+        return bool(self.submodules)
+
     @benchmark
     def syncRefs(self):
         """ Refresh cached refs (`refs` and `refsAt`).
@@ -259,6 +272,11 @@ class RepoModel:
         self.refs = refs
         self.refsAt = refsAt
 
+        # Derive local branch names from the new cache
+        self.localBranchNames = tuple(sorted(name.removeprefix(RefPrefix.HEADS) for name in refs
+                                             if name.startswith(RefPrefix.HEADS)))
+        self.localBranchNameSet = frozenset(self.localBranchNames)
+
         # Since the refs have changed, we need to refresh hidden refs
         self.refreshHiddenRefCache()
 
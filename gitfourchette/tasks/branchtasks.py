@@ -4,7 +4,9 @@
 # For full terms, see the included LICENSE file.
 # -----------------------------------------------------------------------------
 
+import bisect
 import logging
+from collections.abc import Sequence
 
 from gitfourchette.forms.newbranchdialog import NewBranchDialog
 from gitfourchette.forms.resetheaddialog import ResetHeadDialog
@@ -21,6 +23,17 @@ from gitfourchette.toolbox import *
 logger = logging.getLogger(__name__)
 
 
+def branchesInFolder(sortedBranchNames: Sequence[str], folderNameSlash: str) -> Sequence[str]:
+    """
+    Return the branches inside the given folder, as a contiguous slice of
+    sortedBranchNames (e.g. RepoModel.localBranchNames, which is kept sorted).
+    """
+    assert folderNameSlash.endswith("/")
+    lo = bisect.bisect_left(sortedBranchNames, folderNameSlash)
+    hi = bisect.bisect_left(sortedBranchNames, folderNameSlash[:-1] + chr(ord("/") + 1), lo)
+    return sortedBranchNames[lo:hi]
+
+
 class SwitchBranch(RepoTask):
     def prereqs(self) -> TaskPrereqs:
         return TaskPrereqs.NoConflicts
@@ -44,7 +57,7 @@ class SwitchBranch(RepoTask):
             verb = _("Switch")
 
             recurseCheckbox = None
-            anySubmodules = bool(self.repo.listall_submodules_fast())
+            anySubmodules = self.repoModel.hasSubmodules
             anySubmodules &= pygit2_version_at_least("1.15.1", False)  # TODO: Nuke this once we can drop support for old versions of pygit2
             if anySubmodules:
                 recurseCheckbox = QCheckBox(_("Update submodules recursively"))
@@ -82,8 +95,7 @@ class RenameBranch(RepoTask):
     def flow(self, oldBranchName: str):
         assert not oldBranchName.startswith(RefPrefix.HEADS)
 
-        forbiddenBranchNames = self.repo.listall_branches(BranchType.LOCAL)
-        forbiddenBranchNames.remove(oldBranchName)
+        forbiddenBranchNames = self.repoModel.localBranchNameSet - {oldBranchName}
 
         nameTaken = _("This name is already taken by another local branch.")
 
@@ -113,31 +125,37 @@ class RenameBranch(RepoTask):
 
 
 class RenameBranchFolder(RepoTask):
+    progressDialog: QProgressDialog | None = None
+
     def flow(self, oldFolderRefName: str):
         prefix, oldFolderName = RefPrefix.split(oldFolderRefName)
         assert prefix == RefPrefix.HEADS
         assert not oldFolderName.endswith("/")
         oldFolderNameSlash = oldFolderName + "/"
 
-        forbiddenBranches = set()
-        folderBranches = []
-        for oldBranchName in self.repo.listall_branches(BranchType.LOCAL):
-            if oldBranchName.startswith(oldFolderNameSlash):
-                folderBranches.append(oldBranchName)
-            else:
-                forbiddenBranches.add(oldBranchName)
+        # The cached names are good enough to fill in the dialog and validate input.
+        # The branches to rename are re-listed from libgit2 once the user confirms.
+        folderBranches = branchesInFolder(self.repoModel.localBranchNames, oldFolderNameSlash)
+        forbiddenBranches = self.repoModel.localBranchNameSet.difference(folderBranches)
 
-        def transformBranchName(branchName: str, newFolderName: str) -> str:
-            assert branchName.startswith(oldFolderName)
-            newBranchName = newFolderName + branchName.removeprefix(oldFolderName)
-            newBranchName = newBranchName.removeprefix("/")
-            return newBranchName
+        def folderSuffixes(branchNames: Sequence[str]) -> list[str]:
+            # Every suffix starts with "/" because all these branches live under oldFolderNameSlash.
+            return [b[len(oldFolderName):] for b in branchNames]
+
+        def transformBranchNames(newFolderName: str, suffixes: list[str]) -> list[str]:
+            if not newFolderName:
+                # Moving to the root folder: drop the leading slash
+                return [suffix[1:] for suffix in suffixes]
+            return [newFolderName + suffix for suffix in suffixes]
+
+        # The validator runs on every keystroke, so precompute what doesn't depend on the input.
+        cachedSuffixes = folderSuffixes(folderBranches)
 
         def validate(newFolderName: str) -> str:
-            for oldBranchName in folderBranches:
-                newBranchName = transformBranchName(oldBranchName, newFolderName)
-                if newBranchName in forbiddenBranches:
-                    return _("This name clashes with existing branch {0}.", tquo(newBranchName))
+            newBranchNames = set(transformBranchNames(newFolderName, cachedSuffixes))
+            clashes = newBranchNames & forbiddenBranches
+            if clashes:
+                return _("This name clashes with existing branch {0}.", tquo(min(clashes)))
             # Finally validate the folder name itself as if it were a branch,
             # but don't test against existing refs (which we just did above),
             # and allow an empty name.
@@ -168,13 +186,27 @@ class RenameBranchFolder(RepoTask):
         if newFolderName == oldFolderName:
             raise AbortTask()
 
+        # RepoModel's ref cache may be stale, and it skips symbolic refs; ask libgit2 what to rename
+        yield from self.flowEnterWorkerThread()
+        folderBranches = sorted(b for b in self.repo.listall_branches(BranchType.LOCAL)
+                                if b.startswith(oldFolderNameSlash))
+        newBranchNames = transformBranchNames(newFolderName, folderSuffixes(folderBranches))
+        yield from self.flowEnterUiThread()
+
+        # Each rename rewrites a ref and its reflog, so show progress if renaming takes a while
+        progress = _RenameProgressDialog(len(folderBranches), self.parentWidget())
+        progress.setWindowTitle(_("Rename branch folder"))
+        self.progressDialog = progress
+
         # Perform rename
         yield from self.flowEnterWorkerThread()
         self.effects |= TaskEffects.Refs
 
-        for oldBranchName in folderBranches:
-            newBranchName = transformBranchName(oldBranchName, newFolderName)
-            self.repo.rename_local_branch(oldBranchName, newBranchName)
+        self.repo.rename_local_branches(
+            zip(folderBranches, newBranchNames, strict=True),
+            progress_callback=progress.renamed.emit)
+
+        yield from self.flowEnterUiThread()
 
         self.postStatus = (
                 _("Branch folder {0} renamed to {1}.", tquo(oldFolderName), tquo(newFolderName))
@@ -182,12 +214,45 @@ class RenameBranchFolder(RepoTask):
                 + _n("{n} branch affected.", "{n} branches affected.", len(folderBranches))
         )
 
+    def cleanup(self):
+        super().cleanup()
+        if self.progressDialog is not None:
+            self.progressDialog.close()
+            self.progressDialog.deleteLater()
+            self.progressDialog = None
+
+
+class _RenameProgressDialog(QProgressDialog):
+    renamed = Signal(int)
+
+    def __init__(self, count: int, parent):
+        super().__init__(parent)
+        self.setLabelText(_("Please wait…"))
+        self.setRange(0, count)
+        self.setCancelButton(None)  # a half-renamed folder would be worse than waiting
+        self.setWindowModality(Qt.WindowModality.WindowModal)
+        self.setMinimumWidth(self.fontMetrics().horizontalAdvance('W' * 40))
+        self.renamed.connect(self._showProgress)
+
+        # Delay progress popup to avoid flashing when renaming is fast enough.
+        # Unlike blame, the step count is known up front, so QProgressDialog's
+        # own minimumDuration can do this (no need for a separate QTimer).
+        # It only arms its delayed popup once the value sits at the minimum.
+        # (In unit tests, show it immediately for code coverage.)
+        self.setMinimumDuration(200 if not APP_TESTMODE else 0)
+        self.setValue(0)
+
+    def _showProgress(self, n: int):
+        assert onAppThread()
+        self.setLabelText(_("Renaming branch {0} of {1}…", n, self.maximum()))
+        self.setValue(n)
+
 
 class DeleteBranch(RepoTask):
     def flow(self, localBranchName: str):
         assert not localBranchName.startswith(RefPrefix.HEADS)
 
-        if localBranchName == self.repo.head_branch_shorthand:
+        if localBranchName == self.repoModel.homeBranch:
             text = paragraphs(
                 _("Cannot delete {0} because it is the current branch.", bquo(localBranchName)),
                 _("Before you try again, switch to another branch."))
@@ -202,9 +267,8 @@ class DeleteBranch(RepoTask):
             buttonIcon="SP_DialogDiscardButton")
 
         yield from self.flowEnterWorkerThread()
-        target = self.repo.branches[localBranchName].target
         self.effects |= TaskEffects.Refs
-        self.repo.delete_local_branch(localBranchName)
+        target = self.repo.delete_local_branch(localBranchName)
 
         self.postStatus = _("Branch {0} deleted (commit at tip was {1}).",
                             tquo(localBranchName), tquo(shortHash(target)))
@@ -217,15 +281,14 @@ class DeleteBranchFolder(RepoTask):
         assert not folderName.endswith("/")
         folderNameSlash = folderName + "/"
 
-        currentBranch = self.repo.head_branch_shorthand
+        currentBranch = self.repoModel.homeBranch
         if currentBranch.startswith(folderNameSlash):
             text = paragraphs(
                 _("Cannot delete folder {0} because it contains the current branch {1}.", bquo(folderName), bquo(currentBranch)),
                 _("Before you try again, switch to another branch."))
             raise AbortTask(text)
 
-        folderBranches = [b for b in self.repo.listall_branches(BranchType.LOCAL)
-                          if b.startswith(folderNameSlash)]
+        folderBranches = branchesInFolder(self.repoModel.localBranchNames, folderNameSlash)
 
         text = paragraphs(
             _("Really delete local branch folder {0}?", bquo(folderName)),
@@ -239,11 +302,19 @@ class DeleteBranchFolder(RepoTask):
             verb=_("Delete folder"),
             buttonIcon="SP_DialogDiscardButton")
 
+        # RepoModel's ref cache may be stale, and it skips symbolic refs; ask libgit2 what to delete
         yield from self.flowEnterWorkerThread()
+        folderBranches = sorted(b for b in self.repo.listall_branches(BranchType.LOCAL)
+                                if b.startswith(folderNameSlash))
+        yield from self.flowEnterUiThread()
+
         self.effects |= TaskEffects.Refs
 
-        for b in folderBranches:
-            self.repo.delete_local_branch(b)
+        # Delete the branches with as few git processes as possible,
+        # but keep each command line reasonably short.
+        batchSize = 500
+        for i in range(0, len(folderBranches), batchSize):
+            yield from self.flowCallGit("branch", "-D", *folderBranches[i: i + batchSize])
 
         self.postStatus = _n("{n} branch deleted in folder {name}.",
                              "{n} branches deleted in folder {name}.",
@@ -265,33 +336,40 @@ class NewBranchFromCommit(RepoTask):
             if not localName:
                 localName = repo.head.shorthand
 
+        # Looking up upstreams reads the config for each branch; keep it off the UI thread
+        yield from self.flowEnterWorkerThread()
+
         # Collect upstream names and set initial localName (if we haven't been able to set it above).
+        # Ensure no duplicate upstreams, but preserve their order.
         refsPointingHere = repo.listall_refs_pointing_at(tip)
         upstreams = []
+        seenUpstreams = set()
         for r in refsPointingHere:
             prefix, shorthand = RefPrefix.split(r)
+            upstream = ""
             if prefix == RefPrefix.HEADS:
                 if not localName:
                     localName = shorthand
                 branch = repo.branches[shorthand]
                 if branch.upstream:
-                    upstreams.append(branch.upstream.shorthand)
+                    upstream = branch.upstream.shorthand
             elif prefix == RefPrefix.REMOTES:
                 if not localName:
                     _prefix, localName = split_remote_branch_shorthand(shorthand)
-                upstreams.append(shorthand)
+                upstream = shorthand
+            if upstream and upstream not in seenUpstreams:
+                seenUpstreams.add(upstream)
+                upstreams.append(upstream)
 
         # Start with a unique name so the branch validator doesn't shout at us
-        forbiddenBranchNames = repo.listall_branches(BranchType.LOCAL)
+        forbiddenBranchNames = self.repoModel.localBranchNameSet
         localName = withUniqueSuffix(localName, forbiddenBranchNames)
 
-        # Ensure no duplicate upstreams (stable order since Python 3.7+)
-        upstreams = list(dict.fromkeys(upstreams))
-
-        forbiddenBranchNames = repo.listall_branches(BranchType.LOCAL)
-
         commitMessage = repo.get_commit_message(tip)
         commitMessage, junk = messageSummary(commitMessage)
+        anyConflicts = repo.any_conflicts
+
+        yield from self.flowEnterUiThread()
 
         dlg = NewBranchDialog(
             initialName=localName,
@@ -299,13 +377,10 @@ class NewBranchFromCommit(RepoTask):
             targetSubtitle=commitMessage,
             upstreams=upstreams,
             reservedNames=forbiddenBranchNames,
-            allowSwitching=not self.repo.any_conflicts,
+            allowSwitching=not anyConflicts,
+            hasSubmodules=self.repoModel.hasSubmodules,
             parent=self.parentWidget())
 
-        if not repo.listall_submodules_fast():
-            dlg.ui.recurseSubmodulesCheckBox.setChecked(False)
-            dlg.ui.recurseSubmodulesCheckBox.setVisible(False)
-
         if suggestUpstream:
             upstreamIndex = dlg.ui.upstreamComboBox.findText(suggestUpstream)
             if upstreamIndex >= 0:
@@ -405,11 +480,14 @@ class ResetHead(RepoTask):
         return TaskPrereqs.NoUnborn | TaskPrereqs.NoDetached
 
     def flow(self, onto: Oid):
-        branchName = self.repo.head_branch_shorthand
+        branchName = self.repoModel.homeBranch
+        hasSubmodules = self.repoModel.hasSubmodules
+
+        # Reading the commit may inflate a pack entry
+        yield from self.flowEnterWorkerThread()
         commitMessage = self.repo.get_commit_message(onto)
-        submoduleDict = self.repo.listall_submodules_dict()
-        hasSubmodules = bool(submoduleDict)
 
+        yield from self.flowEnterUiThread()
         dlg = ResetHeadDialog(onto, branchName, commitMessage, hasSubmodules, parent=self.parentWidget())
 
         dlg.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)  # don't leak dialog
@@ -438,7 +516,7 @@ class FastForwardBranch(RepoTask):
     def flow(self, localBranchName: str = ""):
         if not localBranchName:
             self.checkPrereqs(TaskPrereqs.NoUnborn | TaskPrereqs.NoDetached)
-            localBranchName = self.repo.head_branch_shorthand
+            localBranchName = self.repoModel.homeBranch
 
         branch = self.repo.branches.local[localBranchName]
         upstream: Branch = branch.upstream
@@ -448,7 +526,7 @@ class FastForwardBranch(RepoTask):
 
         remoteBranchName = upstream.shorthand
 
-        upToDate = yield from self._withGit(branch)
+        upToDate = yield from self._withGit(branch, upstream)
 
         ahead = False
         if upToDate:
@@ -486,11 +564,10 @@ class FastForwardBranch(RepoTask):
         else:
             super().onError(exc)
 
-    def _withGit(self, branch: Branch):
+    def _withGit(self, branch: Branch, upstream: Branch):
         # Perform merge analysis with libgit2 first
         yield from self.flowEnterWorkerThread()
-        upstream = branch.upstream
-        analysis, _mergePref = self.repo.merge_analysis(branch.upstream.target, branch.name)
+        analysis, _mergePref = self.repo.merge_analysis(upstream.target, branch.name)
 
         if analysis & MergeAnalysis.UP_TO_DATE:
             # Local branch is up to date with remote branch, nothing to do.
@@ -508,15 +585,15 @@ class FastForwardBranch(RepoTask):
         self.effects |= TaskEffects.Refs
         if branch.is_checked_out():
             self.effects |= TaskEffects.Head
-            args = ["merge", "--ff-only", "--progress", branch.upstream_name]
+            args = ["merge", "--ff-only", "--progress", upstream.name]
         else:
-            args = ["push", ".", f"{branch.upstream_name}:{branch.name}"]
+            args = ["push", ".", f"{upstream.name}:{branch.name}"]
 
         yield from self.flowEnterUiThread()
         driver = yield from self.flowCallGit(*args, autoFail=False)
 
         if driver.exitCode() != 0:
-            raise DivergentBranchesError(branch, branch.upstream)
+            raise DivergentBranchesError(branch, upstream)
 
         return False
 
@@ -570,7 +647,8 @@ class MergeBranch(RepoTask):
         elif analysis == MergeAnalysis.FASTFORWARD | MergeAnalysis.NORMAL:
             if silentFastForward:
                 wantMergeCommit = False
-                if len(self.repo.get_unstaged_changes()) > 0:
+                # No staged changes at this point, so any file in the status has unstaged changes
+                if self.repo.status():
                     stashAndReapply = yield from self.flowConfirm("Unstaged files!", "Do you want to stash and reapply unstaged files?", verb="Yes", cancelText="Cancel")
                     if not stashAndReapply:
                         return
@@ -592,9 +670,10 @@ class MergeBranch(RepoTask):
         # Actually perform the fast-forward or the merge
 
         if stashAndReapply:
-            files = list(self.repo.status().keys())
-            stashOid = self.repo.create_stash("auto stash", files)
-            self.repo.restore_files_from_head(files)
+            # List the paths only now: files may have changed while the user was looking at the prompt
+            stashPaths = list(self.repo.status())
+            stashOid = self.repo.create_stash("auto stash", stashPaths)
+            self.repo.restore_files_from_head(stashPaths)
 
         yield from self._withGit(wantMergeCommit, theirShorthand)
 
@@ -305,7 +305,7 @@ class CheckoutCommit(RepoTask):
 
         commitMessage = self.repo.get_commit_message(oid)
         commitMessage, junk = messageSummary(commitMessage)
-        anySubmodules = bool(self.repo.listall_submodules_fast())
+        anySubmodules = self.repoModel.hasSubmodules
         anySubmodules &= pygit2_version_at_least("1.15.1", False)  # TODO: Nuke this once we can drop support for old versions of pygit2
 
         dlg = CheckoutCommitDialog(
@@ -507,12 +507,11 @@ class RestoreRevisionToWorkdir(RepoTask):
 
 class AbortMerge(RepoTask):
     def flow(self):
-        self.repo.refresh_index()
+        anyConflicts = self.repo.refresh_index_and_check_conflicts()
 
         isMerging = self.repo.state() == RepositoryState.MERGE
         isCherryPicking = self.repo.state() == RepositoryState.CHERRYPICK
         isReverting = self.repo.state() == RepositoryState.REVERT
-        anyConflicts = self.repo.index.conflicts
 
         if not (isMerging or isCherryPicking or isReverting or anyConflicts):
             raise AbortTask(_("No abortable state is in progress."), icon='information')
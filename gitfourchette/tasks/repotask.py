@@ -145,6 +145,15 @@ FlowControlToken.BootstrapFlow = FlowControlToken()
 
 
 class FlowWorkerThread(QThread):
+    """
+    Runs the non-UI sections of a task's coroutine.
+
+    Each RepoTaskRunner owns a single FlowWorkerThread and runs one task at
+    a time. The UI thread joins this thread before processing the next
+    token. So, the repository is never accessed by two task sections
+    concurrently, even though the sections may hop between threads.
+    """
+
     tokenReady = Signal(FlowControlToken)
 
     flow: RepoTask.FlowGeneratorType | None
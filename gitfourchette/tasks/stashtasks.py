@@ -4,6 +4,8 @@
 # For full terms, see the included LICENSE file.
 # -----------------------------------------------------------------------------
 
+from pathlib import Path
+
 from gitfourchette.forms.stashdialog import StashDialog
 from gitfourchette.localization import *
 from gitfourchette.nav import NavLocator
@@ -13,27 +15,30 @@ from gitfourchette.tasks.repotask import AbortTask, RepoTask, TaskEffects, TaskP
 from gitfourchette.toolbox import *
 from gitfourchette.trash import Trash
 
+_TRASH_TEMPLATE = """\
+To recover this stash, paste the hash below into "Repo > Recall Lost Commit" in {app}:
 
-def backupStash(repo: Repo, stashCommitId: Oid):
-    trashFile = Trash.instance().newFile(repo.workdir, ext=".txt", originalPath="DELETED_STASH")
-
-    if not trashFile:
-        return
-
-    text = F"""\
-To recover this stash, paste the hash below into "Repo > Recall Lost Commit" in {qAppName()}:
-
-{stashCommitId}
+{oid}
 
 ----------------------------------------
 
 Original stash message below:
 
-{repo.peel_commit(stashCommitId).message}
+{message}
 """
 
-    with open(trashFile, "w", encoding="utf-8") as f:
-        f.write(text)
+
+def backupStash(repo: Repo, stashCommitId: Oid, stashCommit: Commit | None = None):
+    trashFile = Trash.instance().newFile(repo.workdir, ext=".txt", originalPath="DELETED_STASH")
+
+    if not trashFile:
+        return
+
+    if stashCommit is None:  # callers that have already peeled the stash can pass it in
+        stashCommit = repo.peel_commit(stashCommitId)
+
+    text = _TRASH_TEMPLATE.format(app=qAppName(), oid=stashCommitId, message=stashCommit.message)
+    Path(trashFile).write_text(text, "utf-8")
 
 
 class NewStash(RepoTask):
@@ -43,6 +48,8 @@ class NewStash(RepoTask):
         return TaskPrereqs.NoConflicts | TaskPrereqs.NoUnborn
 
     def flow(self, paths: list[str] | None = None):
+        # Scanning the workdir may take a while in large repos
+        yield from self.flowEnterWorkerThread()
         status = self.repo.status(untracked_files="all", ignored=False)
 
         if not status:
@@ -50,13 +57,17 @@ class NewStash(RepoTask):
 
         # Prevent stashing any submodules
         with Benchmark("Query submodules"):
-            for submodulePath in self.repo.listall_submodules_fast():
-                status.pop(submodulePath, None)
+            dirtySubmodules = {path for path in self.repo.listall_submodules_fast()
+                               if status.pop(path, None) is not None}
 
         if not status:
             raise AbortTask(_("There are no uncommitted changes to stash (submodules cannot be stashed)."), "information")
 
-        dlg = StashDialog(status, paths or [], self.parentWidget())
+        if paths and all(path in dirtySubmodules for path in paths):
+            raise AbortTask(_("The selected files cannot be stashed (submodules cannot be stashed)."), "information")
+
+        yield from self.flowEnterUiThread()
+        dlg = StashDialog(status, set(paths or ()), self.parentWidget())
         dlg.setWindowModality(Qt.WindowModality.WindowModal)
         dlg.show()
         yield from self.flowDialog(dlg)
@@ -117,7 +128,7 @@ class ApplyStash(RepoTask):
 
         if deleteAfterApply:
             self.effects |= TaskEffects.Refs
-            backupStash(self.repo, stashCommitId)
+            backupStash(self.repo, stashCommitId, stashCommit)
 
         # Although 'git stash apply stash@{<FULL_COMMIT_ID>}' works fine,
         # 'git stash pop' and 'drop' won't delete the stash if we pass the full
@@ -127,19 +138,20 @@ class ApplyStash(RepoTask):
 
         driver = yield from self.flowCallGit("stash", popOrApply, "--index", str(stashIndex), autoFail=False)
 
-        yield from self.flowEnterWorkerThread()
-        self.repo.refresh_index()
-        anyConflicts = self.repo.index.conflicts
-
-        yield from self.flowEnterUiThread()
-
         if driver.exitCode() == 0:
             if deleteAfterApply:
                 self.postStatus = _("Stash {0} applied and deleted.", tquoe(stashMessage))
             else:
                 self.postStatus = _("Stash {0} applied.", tquoe(stashMessage))
+            return
+
+        # The stash didn't apply cleanly. Find out whether it left conflicts behind.
+        yield from self.flowEnterWorkerThread()
+        anyConflicts = self.repo.refresh_index_and_check_conflicts()
+
+        yield from self.flowEnterUiThread()
 
-        elif anyConflicts:
+        if anyConflicts:
             self.postStatus = _("Stash {0} applied, with conflicts.", tquoe(stashMessage))
             message = [_("Applying the stash {0} has caused merge conflicts "
                          "because your files have diverged since they were stashed.", bquoe(stashMessage))]
@@ -164,10 +176,12 @@ class DropStash(RepoTask):
             verb=_("Delete stash"),
             buttonIcon="SP_DialogDiscardButton")
 
-        backupStash(self.repo, stashCommitId)
+        yield from self.flowEnterWorkerThread()
+        backupStash(self.repo, stashCommitId, stashCommit)
+        stashIndex = self.repo.find_stash_index(stashCommitId)
+        yield from self.flowEnterUiThread()
 
         self.effects |= TaskEffects.Refs
-        stashIndex = self.repo.find_stash_index(stashCommitId)
         stashName = f"stash@{{{stashIndex}}}"  # 'git stash drop' doesn't support --index
         yield from self.flowCallGit("stash", "drop", stashName)
 
@@ -6,6 +6,7 @@
 
 import os
 import re
+from collections.abc import Collection
 from contextlib import suppress
 
 from gitfourchette.porcelain import *
@@ -125,7 +126,7 @@ def dumpTempBlob(
     return path
 
 
-def nameValidationMessage(name: str, reservedNames: list[str], nameTakenMessage: str = "") -> str:
+def nameValidationMessage(name: str, reservedNames: Collection[str], nameTakenMessage: str = "") -> str:
     try:
         validate_refname(name, reservedNames)
     except NameValidationError as exc:
@@ -6,6 +6,7 @@
 
 import re
 
+import pygit2
 import pytest
 
 from gitfourchette.forms.checkoutcommitdialog import CheckoutCommitDialog
@@ -58,6 +59,10 @@ def testNewBranch(tempDir, mainWindow, method, switch):
     else:
         assert repo.head_branch_shorthand == 'master'
 
+    # The cached local branch names must be refreshed after the task
+    assert "hellobranch" in rw.repoModel.localBranchNames
+    assert "hellobranch" in rw.repoModel.localBranchNameSet
+
 
 def testNewBranchThenSwitchBlockedByConflicts(tempDir, mainWindow):
     wd = unpackRepo(tempDir)
@@ -291,6 +296,76 @@ def testRenameBranchFolder(tempDir, mainWindow, method, newName):
     assert "folder1/folder2_donttouchthis/leaf" in repo.branches.local
 
 
+def testRenameBranchFolderPicksUpBranchesMissingFromCache(tempDir, mainWindow):
+    wd = unpackRepo(tempDir)
+    with RepoContext(wd) as repo:
+        repo.create_branch_on_head("folder1/leaf")
+    rw = mainWindow.openRepo(wd)
+    repo = rw.repo
+
+    # Sneak in a branch behind the RepoModel's back
+    repo.create_branch_on_head("folder1/latecomer")
+    assert "folder1/latecomer" not in rw.repoModel.localBranchNameSet
+
+    node = rw.sidebar.findNode(lambda n: n.data == "refs/heads/folder1")
+    triggerMenuAction(rw.sidebar.makeNodeMenu(node), "name")
+    dlg = findQDialog(rw, "rename.+folder")
+    dlg.findChild(QLineEdit).setText("renamed")
+    dlg.accept()
+
+    assert "renamed/leaf" in repo.branches.local
+    assert "renamed/latecomer" in repo.branches.local
+    assert not any(b.startswith("folder1/") for b in repo.branches.local)
+
+
+@pytest.mark.parametrize("count", [3, 40])
+def testRenameBranchFolderProgress(tempDir, mainWindow, monkeypatch, count):
+    shownDialogs = []
+    originalShowEvent = QProgressDialog.showEvent
+
+    def showEvent(dlg, event):
+        shownDialogs.append((dlg.windowTitle(), dlg.maximum()))
+        originalShowEvent(dlg, event)
+
+    monkeypatch.setattr(QProgressDialog, "showEvent", showEvent)
+
+    wd = unpackRepo(tempDir)
+    with RepoContext(wd) as repo:
+        for i in range(count):
+            repo.create_branch_on_head(f"bigfolder/leaf{i:02}")
+    rw = mainWindow.openRepo(wd)
+    repo = rw.repo
+
+    node = rw.sidebar.findNode(lambda n: n.data == "refs/heads/bigfolder")
+    menu = rw.sidebar.makeNodeMenu(node)
+    triggerMenuAction(menu, "name")
+
+    dlg = findQDialog(rw, "rename.+folder")
+    dlg.findChild(QLineEdit).setText("renamed")
+    dlg.accept()
+
+    assert all(f"renamed/leaf{i:02}" in repo.branches.local for i in range(count))
+    assert not any(b.startswith("bigfolder/") for b in repo.branches.local)
+    assert shownDialogs == [("Rename branch folder", count)]
+    assert not any(d.isVisible() for d in rw.findChildren(QProgressDialog))
+
+
+def testRenameLocalBranchesScrubsConfigAfterFailure(tempDir):
+    wd = unpackRepo(tempDir)
+    with RepoContext(wd) as repo:
+        repo.create_branch_on_head("folder1/leaf")
+        repo.create_branch_on_head("folder1/clash")
+        repo.create_branch_on_head("taken")
+        repo.edit_upstream_branch("folder1/leaf", "origin/master")
+
+        with pytest.raises(pygit2.AlreadyExistsError):
+            repo.rename_local_branches([("folder1/leaf", "renamed/leaf"), ("folder1/clash", "taken")])
+
+        assert repo.branches.local["renamed/leaf"].upstream_name == "refs/remotes/origin/master"
+        configText = readFile(f"{wd}/.git/config").decode("utf-8")
+        assert '[branch "folder1/leaf"]' not in configText
+
+
 @pytest.mark.parametrize("method", ["sidebarmenu", "sidebarkey"])
 def testDeleteBranch(tempDir, mainWindow, method):
     wd = unpackRepo(tempDir)
@@ -351,6 +426,24 @@ def testDeleteBranchFolder(tempDir, mainWindow, method):
         assert keep in repo.branches.local
 
 
+def testDeleteBranchFolderPicksUpBranchesMissingFromCache(tempDir, mainWindow):
+    wd = unpackRepo(tempDir)
+    with RepoContext(wd) as repo:
+        repo.create_branch_on_head("folder1/leaf")
+    rw = mainWindow.openRepo(wd)
+    repo = rw.repo
+
+    # Sneak in a branch behind the RepoModel's back
+    repo.create_branch_on_head("folder1/latecomer")
+    assert "folder1/latecomer" not in rw.repoModel.localBranchNameSet
+
+    node = rw.sidebar.findNode(lambda n: n.data == "refs/heads/folder1")
+    triggerMenuAction(rw.sidebar.makeNodeMenu(node), "delete folder")
+    acceptQMessageBox(rw, "really delete.+branch folder")
+
+    assert not any(b.startswith("folder1/") for b in repo.branches.local)
+
+
 @pytest.mark.parametrize("method", ["sidebarmenu", "sidebarkey"])
 def testDeleteCurrentBranch(tempDir, mainWindow, method):
     wd = unpackRepo(tempDir)
@@ -463,6 +463,40 @@ def testPullRemoteBranchAutoFastForward(tempDir, mainWindow, remoteNeedsFetching
     rw.repoModel.graph.getCommitRow(newTip)  # must not raise
 
 
+def testPullRemoteBranchAutoFastForwardStashesFilesChangedDuringPrompt(tempDir, mainWindow):
+    wd = unpackRepo(tempDir)
+    with RepoContext(wd) as repo:
+        writeFile(f"{wd}/big.txt", "".join(f"line {i}\n" for i in range(10)))
+        repo.index.add("big.txt")
+        repo.index.write()
+        oldTip = repo.create_commit_on_head("base")
+        writeFile(f"{wd}/big.txt", "".join(f"line {i}\n" for i in range(9)) + "remote change\n")
+        repo.index.add("big.txt")
+        repo.index.write()
+        newTip = repo.create_commit_on_head("remote")
+
+    makeBareCopy(wd, "localfs", preFetch=True, deleteOtherRemotes=True)
+
+    with RepoContext(wd) as repo:
+        repo.reset(oldTip, ResetMode.HARD)
+    writeFile(f"{wd}/a/a1.txt", "a1\nPENDING CHANGE\n")
+
+    rw = mainWindow.openRepo(wd)
+    rw.jump(NavLocator.inCommit(oldTip, "big.txt"), check=True)
+    triggerMenuAction(mainWindow.menuBar(), "repo/pull")
+
+    # Touch a file that the fast-forward updates while the prompt is up
+    qmb = findQMessageBox(rw, "stash and reapply unstaged files")
+    writeFile(f"{wd}/big.txt", "local change\n" + "".join(f"line {i}\n" for i in range(1, 10)))
+    qmb.accept()
+
+    assert newTip == rw.repo.head_commit_id
+    assert readTextFile(f"{wd}/big.txt").startswith("local change\n")
+    assert readTextFile(f"{wd}/big.txt").endswith("remote change\n")
+    assert readTextFile(f"{wd}/a/a1.txt") == "a1\nPENDING CHANGE\n"
+    assert not rw.repo.listall_stashes()
+
+
 def testPullRemoteBranchAutomaticFastForwardBlockedByConfig(tempDir, mainWindow):
     newTip = Oid(hex="c9ed7bf12c73de26422b7c5a44d74cfce5a8993b")
     oldTip = Oid(hex="42e4e7c5e507e113ebbb7801b16b52cf867b7ce1")
@@ -187,6 +187,42 @@ def testNewStashCantStashSubmodule(tempDir, mainWindow):
     acceptQMessageBox(rw, "no.+changes to stash.+submodules cannot be stashed")
 
 
+def testNewStashOnlySubmoduleSelected(tempDir, mainWindow):
+    wd = unpackRepo(tempDir)
+    submoAbsPath, _submoCommit = reposcenario.submodule(wd)
+    writeFile(f"{submoAbsPath}/dirty.txt", "coucou")
+    writeFile(f"{wd}/a/a1.txt", "a1\nPENDING CHANGE\n")
+    rw = mainWindow.openRepo(wd)
+
+    # The context menu doesn't offer to stash submodules, so go through the file list's stash entry point
+    qlvClickNthRow(rw.dirtyFiles, qlvFindRow(rw.dirtyFiles, "submodir"))
+    rw.dirtyFiles.wantPartialStash()
+    acceptQMessageBox(rw, "selected files cannot be stashed.+submodules cannot be stashed")
+    assert not rw.findChildren(StashDialog)
+
+
+def testNewStashSelectedFileNoLongerDirty(tempDir, mainWindow):
+    wd = unpackRepo(tempDir)
+    writeFile(f"{wd}/a/a1.txt", "a1\nPENDING CHANGE\n")
+    writeFile(f"{wd}/a/a2.txt", "a2\nPENDING CHANGE\n")
+    rw = mainWindow.openRepo(wd)
+
+    qlvClickNthRow(rw.dirtyFiles, qlvFindRow(rw.dirtyFiles, "a/a1.txt"))
+
+    # Commit the selected file behind the app's back (leaving it intact in the workdir)
+    with RepoContext(wd) as repo:
+        repo.index.add("a/a1.txt")
+        repo.index.write()
+        repo.create_commit_on_head("behind the app's back", TEST_SIGNATURE, TEST_SIGNATURE)
+
+    # The other dirty files can still be stashed, so the dialog must come up
+    rw.dirtyFiles.wantPartialStash()
+    dlg: StashDialog = findQDialog(rw, "new stash")
+    assert qlvGetRowData(dlg.ui.fileList, Qt.ItemDataRole.UserRole) == ["a/a2.txt"]
+    assert dlg.tickedPaths() == []
+    dlg.reject()
+
+
 def testPopStash(tempDir, mainWindow):
     wd = unpackRepo(tempDir)
     reposcenario.stashedChange(wd)